@@ -3,13 +3,24 @@ from ast import literal_eval
 
 from flask_restful import Resource
 from sqlalchemy.exc import SQLAlchemyError
-from app import db, memcache_client
+from app import memcache_client
+from cache import (
+    DOG_KEY_CLASS,
+    DOG_LIST_KEY_CLASS,
+    NOT_FOUND,
+    known_dog_ids,
+    mark_not_found,
+    ttl_policy,
+)
 from models import Dogs
+from sharding import dog_store
 from webargs import fields, validate
 from webargs.flaskparser import use_args
 
 ALL_DOGS = 'all_dogs'
 
+DOG_NOT_FOUND = {'error': 'Dog could not be found.'}, 404
+
 request_args = {
     'name': fields.Str(required=True),
     'fur_color': fields.Str(required=False),
@@ -38,16 +49,21 @@ class CreateListDog(Resource):
     args = request_args
 
     def get(self):
+        ttl_policy.record_read(ALL_DOGS)
         # Return memcache instead.
         if memcache_client.get(ALL_DOGS):
             return literal_eval(memcache_client.get(ALL_DOGS).decode('utf8')), 200
         # Get all dogs from database.
         all_dogs = [
             dog.dict_repr()
-            for dog in Dogs.query.all()
+            for dog in dog_store.all()
         ]
         # Store in memcache
-        memcache_client.set(ALL_DOGS, all_dogs, expire=60)
+        memcache_client.set(
+            ALL_DOGS,
+            all_dogs,
+            expire=ttl_policy.ttl_for(DOG_LIST_KEY_CLASS, ALL_DOGS),
+        )
         return all_dogs, 200
 
     @use_args(args)
@@ -57,13 +73,14 @@ class CreateListDog(Resource):
             dog = Dogs(name=name)
             for key, value in args.items():
                 setattr(dog, key, value)
-            dog.save()
+            dog_store.save(dog)
             # Remove all_dogs memcache as it's stale.
+            ttl_policy.record_write(ALL_DOGS)
             memcache_client.delete(ALL_DOGS)
             return dog.dict_repr(), 201
 
         except SQLAlchemyError as exception_message:
-            db.session.rollback()
+            dog_store.rollback()
             return {'error': str(exception_message)}, 403
 
 
@@ -82,21 +99,32 @@ class UpdateDog(Resource):
     @use_args(args)
     def put(self, args):
         dog_id = args.get('id')
-        dog = Dogs.query.filter_by(id=dog_id).first()
+        if not known_dog_ids.might_exist(dog_id):
+            return DOG_NOT_FOUND
+        if memcache_client.get(str(dog_id)) == NOT_FOUND:
+            return DOG_NOT_FOUND
+        dog = dog_store.get(dog_id)
         if not dog:
-            return {'error': 'Dog could not be found.'}, 404
+            mark_not_found(dog_id)
+            return DOG_NOT_FOUND
         try:
             for key, value in args.items():
                 setattr(dog, key, value)
-            dog.save()
+            dog_store.save(dog)
             # Delete all_dogs memcache as it is stale
+            ttl_policy.record_write(ALL_DOGS)
             memcache_client.delete(ALL_DOGS)
             # update memcache with obj id.
-            memcache_client.set(str(dog_id), dog.dict_repr(), expire=60)
+            ttl_policy.record_write(str(dog_id))
+            memcache_client.set(
+                str(dog_id),
+                dog.dict_repr(),
+                expire=ttl_policy.ttl_for(DOG_KEY_CLASS, str(dog_id)),
+            )
             return dog.dict_repr(), 200
 
         except SQLAlchemyError as exception_message:
-            db.session.rollback()
+            dog_store.rollback()
             return {'error': str(exception_message)}, 403
 
 
@@ -105,29 +133,49 @@ class DeleteGetDog(Resource):
     args = request_args
 
     def get(self, dog_id):
+        # Known missing ids never reach memcache or the database.
+        if not known_dog_ids.might_exist(dog_id):
+            return DOG_NOT_FOUND
         # Check if memcache have the data.
-        if not memcache_client.get(str(dog_id)):
-            dog = Dogs.query.filter_by(id=dog_id).first()
+        memcache_data = memcache_client.get(str(dog_id))
+        if memcache_data == NOT_FOUND:
+            return DOG_NOT_FOUND
+        # Reads of known missing ids must not evict hot keys from the policy.
+        ttl_policy.record_read(str(dog_id))
+        if not memcache_data:
+            dog = dog_store.get(dog_id)
             if not dog:
-                return {'error': 'Dog could not be found.'}, 404
+                mark_not_found(dog_id)
+                return DOG_NOT_FOUND
             # Set object into memcache.
-            memcache_client.set(str(dog_id), dog.dict_repr(), expire=60)
+            memcache_client.set(
+                str(dog_id),
+                dog.dict_repr(),
+                expire=ttl_policy.ttl_for(DOG_KEY_CLASS, str(dog_id)),
+            )
+            # Not read back, a concurrent DELETE may have marked it not found.
+            return dog.dict_repr(), 200
 
-        # Always return the memcache data.
-        memcache_data = memcache_client.get(str(dog_id))
         return literal_eval(memcache_data.decode('utf-8')), 200
 
     def delete(self, dog_id):
-        dog = Dogs.query.filter_by(id=dog_id).first()
+        if not known_dog_ids.might_exist(dog_id):
+            return DOG_NOT_FOUND
+        if memcache_client.get(str(dog_id)) == NOT_FOUND:
+            return DOG_NOT_FOUND
+        dog = dog_store.get(dog_id)
         if not dog:
-            return {'error': 'Dog could not be found.'}, 404
+            mark_not_found(dog_id)
+            return DOG_NOT_FOUND
         try:
-            dog.delete()
-            # Delete all_dogs and the single obj from memcache.
-            memcache_client.delete(str(dog_id))
+            dog_store.delete(dog)
+            # Mark the single obj as not found and delete all_dogs from memcache.
+            ttl_policy.record_write(str(dog_id))
+            ttl_policy.record_write(ALL_DOGS)
+            mark_not_found(dog_id)
             memcache_client.delete(ALL_DOGS)
             return 'Deleted Successfully', 200
 
         except SQLAlchemyError as exception_message:
-            db.session.rollback()
+            dog_store.rollback()
             return {'error': str(exception_message)}, 403
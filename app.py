@@ -9,6 +9,7 @@ from pymemcache.client import base
 from webargs.flaskparser import abort, parser
 
 from config import APP_PORT, FLASK_ENV, app_config
+from profiler import query_profiler
 
 name = 'Furry Companion Service'
 
@@ -21,7 +22,10 @@ app.config.from_object(app_config[FLASK_ENV])
 
 db = SQLAlchemy(app)
 
-memcache_client = base.Client(('localhost', 11211))
+query_profiler.init_app(app)
+
+# Pooled so that threaded workers never share a memcache socket.
+memcache_client = base.PooledClient(('localhost', 11211))
 
 
 @app.after_request
@@ -33,12 +37,29 @@ def after_request(response):
 
 def start_resources():
     from api import CreateListDog, DeleteGetDog, UpdateDog
+    from sharding import dog_store
+
+    dog_store.init_app(app)
 
     app_api.add_resource(CreateListDog, '/dog/', endpoint='dog')
     app_api.add_resource(DeleteGetDog, '/dog/<int:dog_id>/', endpoint='target_dog')
     app_api.add_resource(UpdateDog, '/dog_update/', endpoint='target_dog_update')
 
 
+def reset_after_fork():
+    """Drop connections inherited from the parent process.
+
+    Called in each worker right after it is forked so that workers never share
+    database or memcache sockets with the master or with each other. Both are
+    reopened lazily on first use.
+    """
+    from sharding import dog_store
+
+    db.get_engine(app).dispose()
+    dog_store.reset_after_fork()
+    memcache_client.close()
+
+
 @parser.error_handler
 def handle_request_parsing_error(err, req, schema):
     """webargs error handler that uses Flask-RESTful's abort function to return
@@ -0,0 +1,101 @@
+"""Benchmark request throughput against the number of gunicorn workers.
+
+Needs memcached running and a migrated database, same as the app itself.
+
+Run with:
+    >> python3 benchmarks/bench_workers.py
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def hammer(port, path, duration):
+    """Send requests over one keep-alive connection, return responses received."""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        connection.request('GET', path)
+        connection.getresponse().read()
+        done += 1
+    connection.close()
+    return done
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/dog/')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Server did not start on port {}'.format(port))
+
+
+def run(workers, args):
+    env = dict(
+        os.environ,
+        WEB_BIND='127.0.0.1:{}'.format(args.port),
+        WEB_WORKERS=str(workers),
+        WEB_THREADS=str(args.threads),
+    )
+    server = subprocess.Popen(
+        ['gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_ready(args.port)
+        with ProcessPoolExecutor(args.clients) as executor:
+            results = executor.map(
+                hammer,
+                [args.port] * args.clients,
+                [args.path] * args.clients,
+                [args.duration] * args.clients,
+            )
+            return sum(results) / args.duration
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    cores = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--path', default='/dog/')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=cores * 4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=sorted({1, 2, max(1, cores // 2), cores}),
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    print('{:>8} {:>12} {:>8}'.format('workers', 'req/s', 'speedup'))
+    for workers in args.workers:
+        throughput = run(workers, args)
+        baseline = baseline or throughput
+        print('{:>8} {:>12.1f} {:>7.2f}x'.format(workers, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
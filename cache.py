@@ -0,0 +1,274 @@
+"""Cache helpers for furryCompanions."""
+
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app import db, memcache_client
+from config import FLASK_ENV, app_config
+from models import Dogs
+from sharding import dog_store
+
+settings = app_config[FLASK_ENV]
+
+logger = logging.getLogger(__name__)
+
+# Value stored under a dog's memcache key when the dog does not exist.
+NOT_FOUND = b'__not_found__'
+
+# Session.info key collecting dogs inserted in the current transaction.
+CREATED_DOG_IDS = 'created_dog_ids'
+
+# Classes of memcache keys with their own TTL settings.
+DOG_KEY_CLASS = 'dog'
+DOG_LIST_KEY_CLASS = 'dog_list'
+NOT_FOUND_KEY_CLASS = 'not_found'
+
+KeyClass = namedtuple('KeyClass', ['base_ttl', 'max_ttl', 'adaptive'])
+
+
+class TTLPolicy(object):
+    """Chooses memcache TTLs per key class and per key.
+
+    Adaptive key classes start at `base_ttl` and grow towards `max_ttl` as a
+    key's reads outnumber its writes. Every TTL is shortened by a random
+    fraction of up to `jitter` so keys written together do not expire
+    together. Read and write counts are halved every `decay_interval` seconds
+    so keys that cool down fall back to shorter TTLs. The distribution of
+    handed out TTLs is logged every `report_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        key_classes,
+        jitter=0.1,
+        decay_interval=300,
+        report_interval=300,
+        max_tracked_keys=10000,
+        max_samples=1000,
+        rng=None,
+        clock=time.time,
+    ):
+        self.key_classes = key_classes
+        self.jitter = jitter
+        self.decay_interval = decay_interval
+        self.report_interval = report_interval
+        self.max_tracked_keys = max_tracked_keys
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self._counts = OrderedDict()
+        self._samples = {
+            key_class: deque(maxlen=max_samples)
+            for key_class in key_classes
+        }
+        self._decayed_at = self._reported_at = clock()
+        self._lock = threading.Lock()
+
+    def _decay(self):
+        intervals = int((self._clock() - self._decayed_at) // self.decay_interval)
+        if not intervals:
+            return
+        self._decayed_at += intervals * self.decay_interval
+        for key, (reads, writes) in list(self._counts.items()):
+            reads, writes = reads >> intervals, writes >> intervals
+            if reads or writes:
+                self._counts[key] = [reads, writes]
+            else:
+                del self._counts[key]
+
+    def _record(self, key, index):
+        with self._lock:
+            self._decay()
+            counts = self._counts.pop(key, None) or [0, 0]
+            counts[index] += 1
+            self._counts[key] = counts
+            if len(self._counts) > self.max_tracked_keys:
+                self._counts.popitem(last=False)
+
+    def record_read(self, key):
+        self._record(key, 0)
+
+    def record_write(self, key):
+        self._record(key, 1)
+
+    def counts(self, key):
+        """Return the (reads, writes) currently tracked for the key."""
+        with self._lock:
+            return tuple(self._counts.get(key, (0, 0)))
+
+    def ttl_for(self, key_class, key):
+        """Return the TTL in seconds to store the key with."""
+        key_class_settings = self.key_classes[key_class]
+        ttl = key_class_settings.base_ttl
+        if key_class_settings.adaptive:
+            reads, writes = self.counts(key)
+            ttl *= 1 + math.log2(1 + reads / (writes + 1))
+            ttl = min(ttl, key_class_settings.max_ttl)
+        with self._lock:
+            ttl = max(1, int(ttl * (1 - self.jitter * self._rng.random())))
+            self._samples[key_class].append(ttl)
+        self._report()
+        return ttl
+
+    def _report(self):
+        now = self._clock()
+        with self._lock:
+            if now - self._reported_at < self.report_interval:
+                return
+            self._reported_at = now
+        logger.info('Memcache TTL distribution: %s', self.distribution())
+
+    def distribution(self):
+        """Summarise the TTLs recently handed out for each key class."""
+        report = {}
+        with self._lock:
+            samples = {
+                key_class: sorted(ttls)
+                for key_class, ttls in self._samples.items()
+            }
+        for key_class, ttls in samples.items():
+            if not ttls:
+                report[key_class] = {'count': 0}
+                continue
+            report[key_class] = {
+                'count': len(ttls),
+                'min': ttls[0],
+                'max': ttls[-1],
+                'mean': sum(ttls) / len(ttls),
+                'p50': ttls[(len(ttls) - 1) // 2],
+                'p90': ttls[int((len(ttls) - 1) * 0.9)],
+                'p99': ttls[int((len(ttls) - 1) * 0.99)],
+            }
+        return report
+
+
+class KnownDogIds(object):
+    """In-process bitmap of dog ids that exist in the database.
+
+    The bitmap is loaded from the database on first use and reloaded every
+    `refresh_interval` seconds. Only ids up to the highest id seen by the
+    previous load are answered from the bitmap: a lower sequence id may commit
+    after a higher one, but not a whole refresh interval later. Anything above
+    it is reported as possibly existing. Bits are
+    never cleared on delete because SQLite may hand a deleted id out again;
+    deleted dogs are left to the not found marker in memcache instead.
+    """
+
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._bits = bytearray()
+        self._ceiling = 0
+        self._highest_loaded = 0
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _set(self, dog_id):
+        byte, bit = divmod(dog_id, 8)
+        if byte >= len(self._bits):
+            self._bits.extend(bytearray(byte + 1 - len(self._bits)))
+        self._bits[byte] |= 1 << bit
+
+    def _is_set(self, dog_id):
+        byte, bit = divmod(dog_id, 8)
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << bit))
+
+    def _is_stale(self):
+        if self._loaded_at is None:
+            return True
+        return time.time() - self._loaded_at > self.refresh_interval
+
+    def load(self):
+        """Rebuild the bitmap from the ids currently in the database."""
+        self.rebuild([dog_id for (dog_id,) in db.session.query(Dogs.id)])
+
+    def rebuild(self, dog_ids):
+        """Replace the bitmap with the given committed dog ids."""
+        with self._lock:
+            self._bits = bytearray()
+            for dog_id in dog_ids:
+                self._set(dog_id)
+            self._ceiling = self._highest_loaded
+            self._highest_loaded = max(dog_ids, default=0)
+            self._loaded_at = time.time()
+
+    def might_exist(self, dog_id):
+        """Return False only when the dog is known not to exist."""
+        if dog_store.sharded:
+            # Ids are handed out in blocks per process, so ids below the
+            # highest one seen may still be created elsewhere.
+            return True
+        if self._is_stale():
+            # Only one request reloads, the others wait for its result.
+            with self._load_lock:
+                if self._is_stale():
+                    self.load()
+        with self._lock:
+            return dog_id > self._ceiling or self._is_set(dog_id)
+
+    def add(self, dog_id):
+        with self._lock:
+            self._set(dog_id)
+
+    def clear(self):
+        with self._lock:
+            self._bits = bytearray()
+            self._ceiling = 0
+            self._highest_loaded = 0
+            self._loaded_at = None
+
+
+known_dog_ids = KnownDogIds(refresh_interval=settings.KNOWN_IDS_REFRESH_INTERVAL)
+
+ttl_policy = TTLPolicy(
+    key_classes={
+        DOG_KEY_CLASS: KeyClass(
+            base_ttl=settings.MEMCACHE_TIMEOUT,
+            max_ttl=settings.MEMCACHE_MAX_TIMEOUT,
+            adaptive=True,
+        ),
+        DOG_LIST_KEY_CLASS: KeyClass(
+            base_ttl=settings.MEMCACHE_TIMEOUT,
+            max_ttl=settings.MEMCACHE_MAX_TIMEOUT,
+            adaptive=True,
+        ),
+        NOT_FOUND_KEY_CLASS: KeyClass(
+            base_ttl=settings.MEMCACHE_NOT_FOUND_TIMEOUT,
+            max_ttl=settings.MEMCACHE_NOT_FOUND_TIMEOUT,
+            adaptive=False,
+        ),
+    },
+    jitter=settings.MEMCACHE_TTL_JITTER,
+    report_interval=settings.MEMCACHE_TTL_REPORT_INTERVAL,
+)
+
+
+def mark_not_found(dog_id):
+    """Remember in memcache that the dog does not exist."""
+    key = str(dog_id)
+    memcache_client.set(key, NOT_FOUND, expire=ttl_policy.ttl_for(NOT_FOUND_KEY_CLASS, key))
+
+
+@event.listens_for(Dogs, 'after_insert')
+def remember_created_dog(mapper, connection, target):
+    session = object_session(target)
+    session.info.setdefault(CREATED_DOG_IDS, set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def forget_not_found_markers(session):
+    # Only clear markers once the new rows are visible to other requests.
+    for dog_id in session.info.pop(CREATED_DOG_IDS, ()):
+        known_dog_ids.add(dog_id)
+        memcache_client.delete(str(dog_id))
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def drop_created_dogs(session, previous_transaction):
+    session.info.pop(CREATED_DOG_IDS, None)
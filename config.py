@@ -21,6 +21,19 @@ class Config(object):
 
     # Memcache Settings
     MEMCACHE_TIMEOUT = int(os.getenv('MEMCACHE_TIMEOUT', 60))
+    MEMCACHE_MAX_TIMEOUT = int(os.getenv('MEMCACHE_MAX_TIMEOUT', 600))
+    MEMCACHE_TTL_JITTER = float(os.getenv('MEMCACHE_TTL_JITTER', 0.1))
+    MEMCACHE_TTL_REPORT_INTERVAL = int(os.getenv('MEMCACHE_TTL_REPORT_INTERVAL', 300))
+    MEMCACHE_NOT_FOUND_TIMEOUT = int(os.getenv('MEMCACHE_NOT_FOUND_TIMEOUT', 5))
+    KNOWN_IDS_REFRESH_INTERVAL = int(os.getenv('KNOWN_IDS_REFRESH_INTERVAL', 300))
+
+    # Sharding Settings
+    DOG_SHARD_URLS = [url for url in os.getenv('DOG_SHARD_URLS', '').split(',') if url]
+    DOG_ID_BLOCK_SIZE = int(os.getenv('DOG_ID_BLOCK_SIZE', 100))
+
+    # Query profiler Settings
+    SLOW_QUERY_THRESHOLD = float(os.getenv('SLOW_QUERY_THRESHOLD', 0.25))
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 3))
 
 
 class DevelopmentConfig(Config):
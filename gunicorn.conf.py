@@ -0,0 +1,29 @@
+"""Gunicorn settings for running furryCompanions in production.
+
+Run with:
+    >> gunicorn -c gunicorn.conf.py wsgi:app
+
+Send HUP to the master process to gracefully reload workers.
+"""
+
+import multiprocessing
+import os
+
+from config import APP_PORT
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:{}'.format(APP_PORT))
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('WEB_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+
+# Preloading shares the app's memory between workers, but a HUP then only
+# restarts workers and does not pick up new code.
+preload_app = os.getenv('WEB_PRELOAD', 'false').lower() == 'true'
+
+
+def post_fork(server, worker):
+    from app import reset_after_fork
+
+    reset_after_fork()
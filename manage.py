@@ -1,13 +1,40 @@
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import Migrate, MigrateCommand, upgrade
 from flask_script import Manager
 
 from app import app, db
 from models import Dogs
+from sharding import dog_store
 
 Migrate(app, db)
 manager = Manager(app)
 
 manager.add_command('db', MigrateCommand)
 
+
+@manager.command
+def upgrade_shards():
+    """Run the migrations on every dog shard in DOG_SHARD_URLS."""
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+    try:
+        for shard_url in app.config['DOG_SHARD_URLS']:
+            app.config['SQLALCHEMY_DATABASE_URI'] = shard_url
+            # Shards only hold dogs, id_blocks lives in the main database.
+            upgrade(x_arg='shard=true')
+    finally:
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+
+
+@manager.command
+def move_dogs_to_shards():
+    """Move dogs from the main dogs table to their shards in DOG_SHARD_URLS."""
+    dog_store.configure(
+        shard_urls=app.config['DOG_SHARD_URLS'],
+        allocator_url=app.config['SQLALCHEMY_DATABASE_URI'],
+        block_size=app.config['DOG_ID_BLOCK_SIZE'],
+    )
+    moved = dog_store.move_unsharded_dogs()
+    print('Moved {} dogs to {} shards.'.format(moved, len(dog_store.engines)))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,42 @@
+"""add id_blocks for sharded dog ids
+
+Revision ID: 3c1f7b9d2e4a
+Revises: aad74cfab4e8
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f7b9d2e4a'
+down_revision = 'aad74cfab4e8'
+branch_labels = None
+depends_on = None
+
+
+def is_shard():
+    # Set by `manage.py upgrade_shards`, id_blocks only lives in the main database.
+    return context.get_x_argument(as_dictionary=True).get('shard') == 'true'
+
+
+def upgrade():
+    if is_shard():
+        return
+    op.create_table('id_blocks',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('next_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Start after existing dogs so sharded ids never reuse an unsharded one.
+    op.execute(
+        "INSERT INTO id_blocks (name, next_id) "
+        "SELECT 'dogs', COALESCE(MAX(dog_id), 0) + 1 FROM dogs"
+    )
+
+
+def downgrade():
+    if is_shard():
+        return
+    op.drop_table('id_blocks')
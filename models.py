@@ -50,3 +50,18 @@ class Dogs(db.Model):
             'created_on': self.created_on.isoformat(),
             'updated_on': self.updated_on.isoformat(),
         }
+
+
+class IdBlocks(db.Model):
+    """Represents the next free id of tables whose ids are handed out in blocks."""
+
+    __tablename__ = 'id_blocks'
+
+    name = Column(String(50), primary_key=True)
+    next_id = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return '<IdBlock:{name}, {next_id}>'.format(
+            name=self.name,
+            next_id=self.next_id,
+        )
@@ -0,0 +1,180 @@
+"""SQL query profiling for furryCompanions."""
+
+import logging
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import FLASK_ENV, app_config
+
+settings = app_config[FLASK_ENV]
+
+logger = logging.getLogger(__name__)
+
+Statement = namedtuple('Statement', ['sql', 'parameters', 'duration', 'engine'])
+
+# Statements whose plan EXPLAIN reports without executing them.
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+
+
+class QueryRecording(object):
+    """SQL statements issued while the recording was active."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def duration(self):
+        return sum(statement.duration for statement in self.statements)
+
+    def repeated(self, threshold):
+        """Return (sql, count) for statements issued at least `threshold` times.
+
+        Statements are only counted together when they ran on the same engine,
+        so one query fanned out over several shards is not an N+1 pattern.
+        """
+        counts = Counter((statement.engine, statement.sql) for statement in self.statements)
+        return [
+            (sql, count)
+            for (engine, sql), count in counts.most_common()
+            if count >= threshold
+        ]
+
+
+class QueryProfiler(object):
+    """Counts and times SQL statements per request.
+
+    Statements slower than `slow_threshold` seconds are logged with their
+    query plan, and statements repeated `n_plus_one_threshold` times within a
+    request are logged as likely N+1 patterns.
+    """
+
+    def __init__(self, slow_threshold, n_plus_one_threshold):
+        self.slow_threshold = slow_threshold
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._local = threading.local()
+        self._started_key = ('query_started', id(self))
+
+    @property
+    def recordings(self):
+        if not hasattr(self._local, 'recordings'):
+            self._local.recordings = []
+        return self._local.recordings
+
+    def start(self):
+        recording = QueryRecording()
+        self.recordings.append(recording)
+        return recording
+
+    def stop(self, recording):
+        self.recordings.remove(recording)
+
+    @contextmanager
+    def record(self):
+        """Record the statements issued by the current thread within the block."""
+        recording = self.start()
+        try:
+            yield recording
+        finally:
+            self.stop(recording)
+
+    @contextmanager
+    def attach(self, recordings):
+        """Add the current thread's statements to another thread's recordings."""
+        previous = self.recordings
+        self._local.recordings = recordings
+        try:
+            yield
+        finally:
+            self._local.recordings = previous
+
+    def listen(self, target):
+        """Hook the profiler into an Engine class or instance."""
+        event.listen(target, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(target, 'after_cursor_execute', self.after_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(self._started_key, []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info[self._started_key].pop()
+        for recording in self.recordings:
+            recording.statements.append(
+                Statement(statement, parameters, duration, conn.engine)
+            )
+        if duration > self.slow_threshold:
+            logger.warning(
+                'Slow query (%.3fs): %s\nParameters: %s\nPlan:\n%s',
+                duration,
+                statement,
+                parameters,
+                self.explain(conn, statement, parameters, executemany),
+            )
+
+    def explain(self, conn, statement, parameters, executemany=False):
+        """Return the query plan of a SELECT, UPDATE or DELETE statement as text."""
+        if executemany or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return '(not available)'
+        if conn.dialect.name == 'sqlite':
+            prefix = 'EXPLAIN QUERY PLAN '
+        else:
+            prefix = 'EXPLAIN '
+        # Use a raw DBAPI cursor so the EXPLAIN is not profiled itself.
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+        except Exception as exception_message:
+            return '(failed: {})'.format(exception_message)
+        finally:
+            cursor.close()
+
+    def report(self, recording, endpoint):
+        logger.debug(
+            '%s issued %d queries in %.3fs',
+            endpoint,
+            recording.count,
+            recording.duration,
+        )
+        for sql, count in recording.repeated(self.n_plus_one_threshold):
+            logger.warning(
+                'Possible N+1 in %s, statement issued %d times: %s',
+                endpoint,
+                count,
+                sql,
+            )
+
+    def init_app(self, app):
+        """Profile the statements issued by every request of the app."""
+        @app.before_request
+        def start_query_recording():
+            g.query_recording = self.start()
+
+        @app.teardown_request
+        def stop_query_recording(exception=None):
+            recording = g.pop('query_recording', None)
+            if recording is not None:
+                self.stop(recording)
+                self.report(recording, request.endpoint)
+
+
+query_profiler = QueryProfiler(
+    slow_threshold=settings.SLOW_QUERY_THRESHOLD,
+    n_plus_one_threshold=settings.N_PLUS_ONE_THRESHOLD,
+)
+query_profiler.listen(Engine)
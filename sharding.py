@@ -0,0 +1,249 @@
+"""Storage of dogs, optionally hash-sharded across several databases."""
+
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+
+from sqlalchemy import create_engine, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from app import db
+from models import Dogs, IdBlocks
+from profiler import query_profiler
+
+id_blocks = IdBlocks.__table__
+
+
+class IdAllocator(object):
+    """Hands out globally unique ids from blocks reserved in the id_blocks table.
+
+    Each process reserves `block_size` ids at a time with a single UPDATE,
+    so only one in every `block_size` inserts touches the shared table.
+    """
+
+    def __init__(self, engine, name, block_size):
+        self.engine = engine
+        self.name = name
+        self.block_size = block_size
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def _reserve_block(self):
+        row = id_blocks.c.name == self.name
+        with self.engine.begin() as connection:
+            updated = connection.execute(
+                id_blocks.update()
+                .where(row)
+                .values(next_id=id_blocks.c.next_id + self.block_size)
+            )
+            if updated.rowcount:
+                end = connection.execute(select([id_blocks.c.next_id]).where(row)).scalar()
+            else:
+                end = 1 + self.block_size
+                connection.execute(id_blocks.insert().values(name=self.name, next_id=end))
+        self._next, self._end = end - self.block_size, end
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._end:
+                try:
+                    self._reserve_block()
+                except IntegrityError:
+                    # Another process created the row first, reserve from it.
+                    self._reserve_block()
+            dog_id = self._next
+            self._next += 1
+            return dog_id
+
+    def skip_to(self, next_id):
+        """Never hand out ids below `next_id`, from any process."""
+        row = id_blocks.c.name == self.name
+        with self.engine.begin() as connection:
+            connection.execute(
+                id_blocks.update()
+                .where(row & (id_blocks.c.next_id < next_id))
+                .values(next_id=next_id)
+            )
+            if connection.execute(select([id_blocks.c.name]).where(row)).first() is None:
+                connection.execute(id_blocks.insert().values(name=self.name, next_id=next_id))
+
+    def reset(self):
+        """Forget the current block so that forked processes never share it."""
+        with self._lock:
+            self._next = self._end = 0
+
+
+class DogStore(object):
+    """Reads and writes dogs.
+
+    Without shards every call goes through `db.session`. With shards, dog
+    `dog_id` lives on shard `dog_id % len(shards)`: single dog calls go
+    straight to that shard, listings query every shard in parallel and merge
+    the results by id.
+    """
+
+    def __init__(self):
+        self.engines = []
+        self.sessions = []
+        self.allocator = None
+        self._executor = None
+
+    @property
+    def sharded(self):
+        return bool(self.engines)
+
+    def init_app(self, app):
+        if app.config.get('DOG_SHARD_URLS'):
+            self.configure(
+                shard_urls=app.config['DOG_SHARD_URLS'],
+                allocator_url=app.config['SQLALCHEMY_DATABASE_URI'],
+                block_size=app.config['DOG_ID_BLOCK_SIZE'],
+            )
+            with app.app_context():
+                self.check_unsharded_dogs()
+
+        @app.teardown_appcontext
+        def remove_shard_sessions(exception=None):
+            self.remove()
+
+    def configure(self, shard_urls, allocator_url, block_size):
+        self.reset()
+        self.engines = [create_engine(url) for url in shard_urls]
+        self.sessions = [
+            scoped_session(sessionmaker(bind=engine))
+            for engine in self.engines
+        ]
+        self.allocator = IdAllocator(create_engine(allocator_url), 'dogs', block_size)
+
+    def reset(self):
+        """Drop the shards, closing their sessions, engines and worker threads."""
+        self.remove()
+        for engine in self.engines:
+            engine.dispose()
+        if self.allocator:
+            self.allocator.engine.dispose()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.engines = []
+        self.sessions = []
+        self.allocator = None
+        self._executor = None
+
+    def check_unsharded_dogs(self):
+        """Refuse to shard while the main dogs table still holds dogs.
+
+        Sharded reads never look at the main table, so its dogs would be
+        hidden from every endpoint.
+        """
+        if db.session.query(Dogs.id).first() is not None:
+            raise RuntimeError(
+                'The main dogs table is not empty, move its dogs to the shards '
+                'with: python3 manage.py move_dogs_to_shards'
+            )
+
+    def move_unsharded_dogs(self, batch_size=500):
+        """Move dogs from the main dogs table to their shards.
+
+        Dogs are copied with `merge`, so a move interrupted between the
+        shard commits and the main table delete can simply be run again.
+        Returns the number of dogs moved.
+        """
+        columns = [column.key for column in inspect(Dogs).column_attrs]
+        moved = 0
+        while True:
+            dogs = Dogs.query.order_by(Dogs.id).limit(batch_size).all()
+            if not dogs:
+                return moved
+            for dog in dogs:
+                copy = Dogs(**{column: getattr(dog, column) for column in columns})
+                self.session_for(dog.id).merge(copy)
+            for session in self.sessions:
+                session.commit()
+            self.allocator.skip_to(dogs[-1].id + 1)
+            dog_ids = [dog.id for dog in dogs]
+            Dogs.query.filter(Dogs.id.in_(dog_ids)).delete(synchronize_session=False)
+            db.session.commit()
+            moved += len(dogs)
+
+    def create_tables(self):
+        """Create missing shard and id_blocks tables without migrations, for tests."""
+        for engine in self.engines:
+            Dogs.__table__.create(bind=engine, checkfirst=True)
+        id_blocks.create(bind=self.allocator.engine, checkfirst=True)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.engines))
+        return self._executor
+
+    def shard_index(self, dog_id):
+        return dog_id % len(self.engines)
+
+    def session_for(self, dog_id):
+        return self.sessions[self.shard_index(dog_id)]
+
+    def get(self, dog_id):
+        if not self.sharded:
+            return Dogs.query.filter_by(id=dog_id).first()
+        return self.session_for(dog_id).query(Dogs).filter_by(id=dog_id).first()
+
+    def save(self, dog):
+        if not self.sharded:
+            dog.save()
+            return
+        if dog.id is None:
+            dog.id = self.allocator.next_id()
+        session = self.session_for(dog.id)
+        session.add(dog)
+        session.commit()
+
+    def delete(self, dog):
+        if not self.sharded:
+            dog.delete()
+            return
+        session = self.session_for(dog.id)
+        session.delete(dog)
+        session.commit()
+
+    def rollback(self):
+        if not self.sharded:
+            db.session.rollback()
+        for session in self.sessions:
+            session.rollback()
+
+    def remove(self):
+        for session in self.sessions:
+            session.remove()
+
+    def _query_shard(self, engine, filters, recordings):
+        with query_profiler.attach(recordings):
+            session = sessionmaker(bind=engine)()
+            try:
+                return session.query(Dogs).filter_by(**filters).order_by(Dogs.id).all()
+            finally:
+                session.close()
+
+    def all(self, **filters):
+        """Return the dogs matching `filters` ordered by id."""
+        if not self.sharded:
+            return Dogs.query.filter_by(**filters).order_by(Dogs.id).all()
+        recordings = query_profiler.recordings
+        shard_results = self.executor.map(
+            lambda engine: self._query_shard(engine, filters, recordings),
+            self.engines,
+        )
+        return list(heapq.merge(*shard_results, key=attrgetter('id')))
+
+    def reset_after_fork(self):
+        for engine in self.engines:
+            engine.dispose()
+        if self.allocator:
+            self.allocator.engine.dispose()
+            self.allocator.reset()
+        self._executor = None
+
+
+dog_store = DogStore()
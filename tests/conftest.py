@@ -1,5 +1,7 @@
 """Global fixtures for app."""
 
+from contextlib import contextmanager
+
 import pytest
 
 
@@ -9,8 +11,10 @@ from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
 
 from app import app, db
+from cache import known_dog_ids
 from config import app_config, FLASK_ENV
 from models import Dogs
+from profiler import query_profiler
 
 app.config.from_object(app_config[FLASK_ENV])
 
@@ -19,6 +23,7 @@ app.config.from_object(app_config[FLASK_ENV])
 def app():
     """For some reason this needs to be defined again."""
     from api import CreateListDog, DeleteGetDog, UpdateDog
+    from sharding import dog_store
     from flask import Flask
     from flask_restful import Api
     from config import app_config, FLASK_ENV
@@ -26,6 +31,8 @@ def app():
     app = Flask('Test Furry Companion Service')
     app.config.from_object(app_config[FLASK_ENV])
     app_api = Api(app=app)
+    query_profiler.init_app(app)
+    dog_store.init_app(app)
 
     app_api.add_resource(CreateListDog, '/dog/', endpoint='dog')
     app_api.add_resource(DeleteGetDog, '/dog/<int:dog_id>/', endpoint='target_dog')
@@ -56,6 +63,24 @@ def client(request, manage, app):
         # clear table after each test.
         db.session.query(Dogs).delete()
         db.session.commit()
+        known_dog_ids.clear()
 
     request.addfinalizer(teardown)
     return app.test_client()
+
+
+@pytest.fixture
+def query_budget():
+    """Assert that a block issues at most `max_queries` SQL statements."""
+
+    @contextmanager
+    def budget(max_queries):
+        with query_profiler.record() as recording:
+            yield recording
+        assert recording.count <= max_queries, \
+            'Issued {} queries, budget is {}:\n{}'.format(
+                recording.count,
+                max_queries,
+                '\n'.join(statement.sql for statement in recording.statements),
+            )
+    return budget
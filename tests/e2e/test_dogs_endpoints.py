@@ -4,7 +4,9 @@ import pytest
 
 from app import db
 from api import ALL_DOGS
+from cache import NOT_FOUND, known_dog_ids
 from models import Dogs
+from sharding import dog_store
 
 
 memcache_response = b"{'name': 'tester', 'age': None, " \
@@ -22,6 +24,22 @@ def dog_instance(client):
     return dog
 
 
+@pytest.fixture
+def sharded(client, tmpdir):
+    """Shard dogs across three SQLite files for the duration of a test."""
+    dog_store.configure(
+        shard_urls=[
+            'sqlite:///{}'.format(tmpdir.join('shard_{}.sqlite3'.format(shard)))
+            for shard in range(3)
+        ],
+        allocator_url='sqlite:///{}'.format(tmpdir.join('main.sqlite3')),
+        block_size=10,
+    )
+    dog_store.create_tables()
+    yield dog_store
+    dog_store.reset()
+
+
 @pytest.fixture
 def mock_memcache_get(mocker):
     """Mock pymemcache to mimic memcache behaviour"""
@@ -140,6 +158,7 @@ def test_deletion_of_existing_dog_object(
     client,
     dog_instance,
     mock_memcache_delete,
+    mock_memcache_set,
 ):
     """Should delete existing row in Dogs model."""
     # given ... one dog instance in database.
@@ -153,9 +172,12 @@ def test_deletion_of_existing_dog_object(
     # then
     # ... response contains success status
     # ... and no data in database.
-    # ... and two keys deleted from memcache.
+    # ... and all_dogs deleted from memcache,
+    # ... and the single obj marked as not found.
     assert response.status_code == 200
-    assert mock_memcache_delete.call_count == 2
+    assert mock_memcache_delete.call_count == 1
+    assert mock_memcache_set.call_args[0] == (str(dog_instance.id), NOT_FOUND)
+    assert mock_memcache_set.call_args[1]['expire'] > 0
     assert db.session.query(Dogs).count() == 0
 
 
@@ -173,10 +195,10 @@ def test_returns_target_dog_with_get_request(
 
     # then
     # ... response is success and target record pulled.
-    # ... memcache called on set and get.
+    # ... memcache called on get only once.
     assert response.status_code == 200
     assert mock_memcache_set.called_once(str(dog_instance.id))
-    assert mock_memcache_get.call_count == 2
+    assert mock_memcache_get.call_count == 1
     assert dog_instance.id == response.get_json().get('id')
 
 
@@ -257,3 +279,244 @@ def test_return_404_error_for_not_finding_resource_for_endpoints(
     # then
     # ... response contains error status not found
     assert response.status_code == 404
+
+
+def test_return_404_for_deleted_dog_without_database(
+    client,
+    dog_instance,
+    mocker,
+    mock_memcache_delete,
+):
+    """Should answer lookups of deleted dogs from the not found marker."""
+    # given ... a dog that has been deleted.
+    dog_id = dog_instance.id
+    client.delete('/dog/{}/'.format(dog_id))
+    mock_query = mocker.patch.object(Dogs, 'query')
+
+    # when ... GET request is made for the deleted dog.
+    response = client.get('/dog/{}/'.format(dog_id))
+
+    # then
+    # ... response is not found without a database lookup,
+    # ... and the id stays in the filter as it may be reused.
+    assert response.status_code == 404
+    assert not mock_query.called
+    assert known_dog_ids.might_exist(dog_id)
+
+
+@pytest.mark.parametrize('http_method', ('get', 'delete'))
+def test_return_404_for_not_found_marker_without_database(
+    http_method,
+    client,
+    dog_instance,
+    mocker,
+    mock_memcache_get,
+):
+    """Should trust the not found marker in memcache."""
+    # given ... memcache marks the dog as not found.
+    mock_memcache_get.return_value = NOT_FOUND
+    mock_query = mocker.patch.object(Dogs, 'query')
+
+    # when ... a request is made for the dog.
+    response = getattr(client, http_method)('/dog/{}/'.format(dog_instance.id))
+
+    # then
+    # ... response is not found without a database lookup.
+    assert response.status_code == 404
+    assert not mock_query.called
+
+
+def test_marks_missing_dog_as_not_found_in_memcache(client, mock_memcache_set, mocker):
+    """Should store a not found marker for ids missing from the database."""
+    # given ... memcache holds nothing for the dog.
+    mocker.patch('pymemcache.client.base.Client.get', return_value=None)
+
+    # when ... GET request is made for a dog that does not exist.
+    response = client.get('/dog/5/')
+
+    # then
+    # ... response is not found and the marker is stored.
+    assert response.status_code == 404
+    assert mock_memcache_set.call_count == 1
+    assert mock_memcache_set.call_args[0] == ('5', NOT_FOUND)
+    assert mock_memcache_set.call_args[1]['expire'] > 0
+
+
+def test_creating_dog_clears_not_found_marker(client, mock_memcache_delete):
+    """Should clear the not found marker and filter entry of a created dog."""
+    # when ... POST is made with correct data
+    response = client.post('/dog/', data={'name': 'name1'})
+
+    # then
+    # ... the new id is known and its marker removed from memcache.
+    dog_id = response.get_json()['id']
+    assert known_dog_ids.might_exist(dog_id)
+    assert (str(dog_id),) in [call[0] for call in mock_memcache_delete.call_args_list]
+
+
+def test_get_target_dog_stays_within_query_budget(
+    client,
+    dog_instance,
+    mock_memcache_set,
+    mocker,
+    query_budget,
+):
+    """Should load a dog missing from memcache with a single query."""
+    # given ... the known ids filter is loaded and memcache is empty.
+    known_dog_ids.load()
+    mocker.patch('pymemcache.client.base.Client.get', return_value=None)
+    endpoint = '/dog/{}/'.format(dog_instance.id)
+
+    # when ... GET request is made to 'dog/<id>/'-endpoint
+    with query_budget(1):
+        response = client.get(endpoint)
+
+    # then ... response is success.
+    assert response.status_code == 200
+
+
+def test_list_dogs_stays_within_query_budget(
+    client,
+    dog_instance,
+    mock_memcache_set,
+    mocker,
+    query_budget,
+):
+    """Should list dogs missing from memcache with a single query."""
+    # given ... memcache is empty.
+    mocker.patch('pymemcache.client.base.Client.get', return_value=None)
+
+    # when ... GET request is made to 'dog'-endpoint
+    with query_budget(1):
+        response = client.get('/dog/')
+
+    # then ... response is success.
+    assert response.status_code == 200
+
+
+def test_update_dog_stays_within_query_budget(
+    client,
+    dog_instance,
+    mock_memcache_delete,
+    mock_memcache_set,
+    query_budget,
+):
+    """Should update a dog with a select, an update and a reload."""
+    # given ... the known ids filter is loaded.
+    known_dog_ids.load()
+    update_data = {'id': dog_instance.id, 'name': 'name'}
+
+    # when ... PUT request is made to 'dog_update/'-endpoint
+    with query_budget(3):
+        response = client.put('/dog_update/', data=update_data)
+
+    # then ... response is success.
+    assert response.status_code == 200
+
+
+def test_missing_dog_lookup_issues_no_queries(client, dog_instance, query_budget):
+    """Should answer repeated lookups of a missing dog without the database."""
+    # given ... a missing dog was looked up once.
+    endpoint = '/dog/{}/'.format(dog_instance.id + 1)
+    client.get(endpoint)
+
+    # when ... the same dog is looked up again
+    with query_budget(0):
+        response = client.get(endpoint)
+
+    # then ... response is not found.
+    assert response.status_code == 404
+
+
+def test_serves_dogs_from_shards(
+    client,
+    sharded,
+    mocker,
+    mock_memcache_set,
+    mock_memcache_delete,
+    query_budget,
+):
+    """Should create, list, update and delete dogs spread over shards."""
+    # given ... memcache is empty and dogs are created on every shard.
+    mocker.patch('pymemcache.client.base.Client.get', return_value=None)
+    for index in range(4):
+        client.post('/dog/', data={'name': 'name{}'.format(index)})
+
+    # when ... dogs are listed, one is updated and another deleted
+    with query_budget(3):
+        listed = client.get('/dog/').get_json()
+    updated = client.put('/dog_update/', data={'id': 2, 'name': 'renamed'})
+    deleted = client.delete('/dog/3/')
+
+    # then
+    # ... the listing is merged in id order with one query per shard,
+    # ... and single dog requests reach the dog's shard.
+    assert [dog['id'] for dog in listed] == [1, 2, 3, 4]
+    assert updated.status_code == 200
+    assert deleted.status_code == 200
+    assert [dog.name for dog in sharded.all()] == ['name0', 'renamed', 'name3']
+
+
+def test_returns_loaded_dog_when_deleted_concurrently(
+    client,
+    dog_instance,
+    mock_memcache_set,
+    mocker,
+):
+    """Should not read memcache back after loading a dog from the database."""
+    # given ... memcache is empty, then marks the dog as deleted.
+    mocker.patch('pymemcache.client.base.Client.get', side_effect=[None, NOT_FOUND])
+
+    # when ... GET request is made to 'dog/<id>/'-endpoint
+    response = client.get('/dog/{}/'.format(dog_instance.id))
+
+    # then ... the dog loaded from the database is returned.
+    assert response.status_code == 200
+    assert response.get_json()['id'] == dog_instance.id
+
+
+def test_sharded_listing_logs_no_n_plus_one(
+    client,
+    sharded,
+    mocker,
+    mock_memcache_set,
+    mock_memcache_delete,
+):
+    """Should not report the scatter over shards as an N+1 pattern."""
+    # given ... memcache is empty and dogs are created on every shard.
+    mocker.patch('pymemcache.client.base.Client.get', return_value=None)
+    for index in range(3):
+        client.post('/dog/', data={'name': 'name{}'.format(index)})
+    logger = mocker.patch('profiler.logger')
+
+    # when ... dogs are listed
+    response = client.get('/dog/')
+
+    # then ... each shard was queried once and no N+1 was reported.
+    assert len(response.get_json()) == 3
+    assert not [
+        call for call in logger.warning.call_args_list
+        if call[0][0].startswith('Possible N+1')
+    ]
+
+
+def test_moves_unsharded_dogs_to_their_shards(client, sharded, mock_memcache_delete):
+    """Should move main table dogs to their shards and allocate ids after them."""
+    # given ... dogs created before sharding was turned on.
+    for index in range(4):
+        Dogs(name='name{}'.format(index)).save()
+    with pytest.raises(RuntimeError):
+        sharded.check_unsharded_dogs()
+
+    # when ... the dogs are moved to the shards
+    moved = sharded.move_unsharded_dogs(batch_size=3)
+
+    # then
+    # ... the main table is empty and each dog is found on its shard,
+    # ... and new ids never reuse a moved one.
+    assert moved == 4
+    assert db.session.query(Dogs).count() == 0
+    sharded.check_unsharded_dogs()
+    assert [dog.name for dog in sharded.all()] == ['name0', 'name1', 'name2', 'name3']
+    assert sharded.get(3).name == 'name2'
+    assert sharded.allocator.next_id() > 4
@@ -0,0 +1,58 @@
+"""Test for the in-process filter of known dog ids."""
+
+import threading
+import time
+
+from cache import KnownDogIds
+
+
+def test_reloads_once_for_concurrent_lookups(mocker):
+    """Should reload a stale filter from a single caller only."""
+    # given ... a stale filter whose reload is slow
+    known_ids = KnownDogIds(refresh_interval=300)
+
+    def load():
+        time.sleep(0.05)
+        known_ids._loaded_at = time.time()
+
+    mocked_load = mocker.patch.object(known_ids, 'load', side_effect=load)
+
+    # when ... several requests look up ids at the same time
+    threads = [
+        threading.Thread(target=known_ids.might_exist, args=(dog_id,))
+        for dog_id in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # then ... the database is read once.
+    assert mocked_load.call_count == 1
+
+
+def test_does_not_hide_ids_that_commit_late():
+    """Should only answer for ids up to the highest id of the previous load."""
+    known_ids = KnownDogIds(refresh_interval=300)
+
+    # when ... id 2 is still uncommitted while 1 and 3 are loaded
+    known_ids.rebuild([1, 3])
+
+    # then ... id 2 may still exist.
+    assert known_ids.might_exist(2)
+
+    # when ... id 2 has committed and id 4 is uncommitted on the next load
+    known_ids.rebuild([1, 2, 3, 5])
+
+    # then ... ids up to the previous highest id are answered from the bitmap,
+    # ... and later ids may still exist.
+    assert known_ids.might_exist(2)
+    assert known_ids.might_exist(4)
+    assert known_ids.might_exist(5)
+
+    # when ... id 3 is deleted and 4 never commits
+    known_ids.rebuild([1, 2, 5])
+
+    # then ... only ids below the previous highest id are known missing.
+    assert not known_ids.might_exist(4)
+    assert known_ids.might_exist(6)
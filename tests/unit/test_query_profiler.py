@@ -0,0 +1,91 @@
+"""Test for the SQL query profiler."""
+
+import pytest
+from sqlalchemy import create_engine
+
+from profiler import QueryProfiler
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    engine.execute('CREATE TABLE dogs (dog_id INTEGER PRIMARY KEY, name VARCHAR(50))')
+    return engine
+
+
+def make_profiler(engine, slow_threshold=10, n_plus_one_threshold=3):
+    profiler = QueryProfiler(
+        slow_threshold=slow_threshold,
+        n_plus_one_threshold=n_plus_one_threshold,
+    )
+    profiler.listen(engine)
+    return profiler
+
+
+def test_counts_and_times_statements(engine):
+    """Should record every statement issued within the block."""
+    profiler = make_profiler(engine)
+
+    # when ... two statements are issued while recording
+    with profiler.record() as recording:
+        engine.execute("INSERT INTO dogs (name) VALUES ('tester')")
+        engine.execute('SELECT * FROM dogs').fetchall()
+    engine.execute('SELECT * FROM dogs').fetchall()
+
+    # then ... only statements inside the block are recorded.
+    assert recording.count == 2
+    assert recording.duration >= 0
+
+
+def test_flags_repeated_statements_as_n_plus_one(engine, mocker):
+    """Should log statements repeated within a request as N+1 patterns."""
+    profiler = make_profiler(engine)
+    select = 'SELECT * FROM dogs WHERE dog_id = ?'
+
+    # when ... the same statement is issued for several ids
+    with profiler.record() as recording:
+        for dog_id in range(3):
+            engine.execute(select, dog_id).fetchall()
+        engine.execute('SELECT count(*) FROM dogs').fetchall()
+    logger = mocker.patch('profiler.logger')
+    profiler.report(recording, 'dog')
+
+    # then ... the repeated statement is flagged.
+    assert recording.repeated(3) == [(select, 3)]
+    logger.warning.assert_called_once_with(
+        'Possible N+1 in %s, statement issued %d times: %s',
+        'dog',
+        3,
+        select,
+    )
+
+
+def test_logs_slow_queries_with_query_plan(engine, mocker):
+    """Should log statements over the threshold with their EXPLAIN plan."""
+    make_profiler(engine, slow_threshold=0)
+    logger = mocker.patch('profiler.logger')
+
+    # when ... a query slower than the threshold is issued
+    engine.execute('SELECT * FROM dogs WHERE name = ?', 'tester').fetchall()
+
+    # then ... the query is logged with its plan.
+    message, duration, statement, parameters, plan = logger.warning.call_args[0]
+    assert message.startswith('Slow query')
+    assert statement == 'SELECT * FROM dogs WHERE name = ?'
+    assert 'SCAN' in plan
+
+
+def test_logs_slow_updates_with_query_plan(engine, mocker):
+    """Should explain slow UPDATE statements without running them twice."""
+    engine.execute("INSERT INTO dogs (name) VALUES ('tester')")
+    make_profiler(engine, slow_threshold=0)
+    logger = mocker.patch('profiler.logger')
+
+    # when ... an update slower than the threshold is issued
+    engine.execute('UPDATE dogs SET name = ? WHERE dog_id = ?', 'renamed', 1)
+
+    # then ... the update is logged with its plan and applied once.
+    statement, plan = logger.warning.call_args[0][2], logger.warning.call_args[0][4]
+    assert statement == 'UPDATE dogs SET name = ? WHERE dog_id = ?'
+    assert 'SEARCH' in plan
+    assert engine.execute('SELECT name FROM dogs').fetchall() == [('renamed',)]
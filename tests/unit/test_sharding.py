@@ -0,0 +1,123 @@
+"""Test for hash-sharded dog storage."""
+
+import pytest
+from sqlalchemy import create_engine
+
+from models import Dogs
+from sharding import DogStore, IdAllocator, id_blocks
+
+SHARDS = 3
+
+
+@pytest.fixture
+def allocator_url(tmpdir):
+    return 'sqlite:///{}'.format(tmpdir.join('main.sqlite3'))
+
+
+@pytest.fixture
+def store(tmpdir, allocator_url):
+    store = DogStore()
+    store.configure(
+        shard_urls=[
+            'sqlite:///{}'.format(tmpdir.join('shard_{}.sqlite3'.format(shard)))
+            for shard in range(SHARDS)
+        ],
+        allocator_url=allocator_url,
+        block_size=4,
+    )
+    store.create_tables()
+    yield store
+    store.reset()
+
+
+def shard_ids(store):
+    """Return the dog ids stored on each shard."""
+    return [
+        sorted(dog_id for (dog_id,) in engine.execute('SELECT dog_id FROM dogs'))
+        for engine in store.engines
+    ]
+
+
+def test_allocates_unique_ids_in_blocks(allocator_url):
+    """Should hand out disjoint blocks of ids to each allocator."""
+    # given ... two processes allocating from the same table
+    engine = create_engine(allocator_url)
+    id_blocks.create(bind=engine)
+    first = IdAllocator(engine, 'dogs', block_size=5)
+    second = IdAllocator(engine, 'dogs', block_size=5)
+
+    # when ... both allocate ids in turn
+    first_ids = [first.next_id()]
+    second_ids = [second.next_id() for _ in range(3)]
+    first_ids += [first.next_id() for _ in range(6)]
+
+    # then ... ids are unique and come from consecutive blocks.
+    assert first_ids == [1, 2, 3, 4, 5, 11, 12]
+    assert second_ids == [6, 7, 8]
+
+
+def test_routes_each_dog_to_its_shard(store):
+    """Should store every dog only on shard dog_id % shards."""
+    # when ... several dogs are saved
+    for index in range(10):
+        store.save(Dogs(name='dog{}'.format(index)))
+
+    # then ... each shard holds exactly the ids hashed to it.
+    assert shard_ids(store) == [
+        [dog_id for dog_id in range(1, 11) if dog_id % SHARDS == shard]
+        for shard in range(SHARDS)
+    ]
+
+
+def test_gets_updates_and_deletes_a_dog_on_its_shard(store):
+    """Should serve single dog operations from the dog's shard."""
+    # given ... a dog saved on a shard
+    dog = Dogs(name='tester')
+    store.save(dog)
+    dog_id = dog.id
+    store.remove()
+
+    # when ... the dog is fetched, updated and deleted
+    dog = store.get(dog_id)
+    dog.name = 'renamed'
+    store.save(dog)
+    store.remove()
+    renamed = store.get(dog_id).name
+    store.delete(store.get(dog_id))
+
+    # then ... every operation hit the right shard.
+    assert renamed == 'renamed'
+    assert store.get(dog_id) is None
+    assert shard_ids(store) == [[], [], []]
+
+
+def test_lists_dogs_across_shards_in_id_order(store):
+    """Should scatter-gather listings and merge them by id."""
+    # given ... dogs spread over every shard
+    for index in range(10):
+        store.save(Dogs(name='dog{}'.format(index), gender='male' if index % 2 else 'female'))
+    store.remove()
+
+    # when ... all dogs and the male dogs are listed
+    all_dogs = store.all()
+    male_dogs = store.all(gender='male')
+
+    # then ... results are merged from every shard in id order.
+    assert [dog.id for dog in all_dogs] == list(range(1, 11))
+    assert [dog.id for dog in male_dogs] == [2, 4, 6, 8, 10]
+    assert all_dogs[0].dict_repr()['name'] == 'dog0'
+
+
+def test_reset_drops_shards_and_worker_threads(store):
+    """Should close everything the shards hold and fall back to db.session."""
+    # given ... a listing has started the worker threads
+    store.all()
+    executor = store.executor
+
+    # when ... the store is reset
+    store.reset()
+
+    # then ... the store is no longer sharded and its threads are stopped.
+    assert not store.sharded
+    assert store.allocator is None
+    assert executor._shutdown
@@ -0,0 +1,137 @@
+"""Test for the memcache TTL policy."""
+
+import random
+
+import pytest
+
+from cache import KeyClass, TTLPolicy
+
+
+class FakeClock(object):
+    """Clock advanced by hand to simulate time passing."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def policy(clock):
+    return TTLPolicy(
+        key_classes={
+            'dog': KeyClass(base_ttl=60, max_ttl=600, adaptive=True),
+            'not_found': KeyClass(base_ttl=5, max_ttl=5, adaptive=False),
+        },
+        jitter=0.1,
+        decay_interval=300,
+        rng=random.Random(0),
+        clock=clock,
+    )
+
+
+def replay(policy, trace):
+    """Replay (operation, key) events and return the last TTL per key."""
+    ttls = {}
+    for operation, key in trace:
+        if operation == 'read':
+            policy.record_read(key)
+            ttls[key] = policy.ttl_for('dog', key)
+        else:
+            policy.record_write(key)
+    return ttls
+
+
+def simulated_trace():
+    """Zipf-like trace: 'hot' is read constantly, 'busy' is rewritten often."""
+    rng = random.Random(1)
+    trace = []
+    for _ in range(2000):
+        trace.append(('read', rng.choice(['hot'] * 20 + ['warm'] * 4 + ['busy', 'cold'])))
+        if rng.random() < 0.1:
+            trace.append(('write', 'busy'))
+    return trace
+
+
+def test_extends_ttl_of_frequently_read_and_rarely_written_keys(policy):
+    """Should hand out longer TTLs to hot keys than to cold or busy ones."""
+    # when ... the simulated trace is replayed
+    ttls = replay(policy, simulated_trace())
+
+    # then
+    # ... hot keys live longest and every TTL stays within the class bounds.
+    assert ttls['hot'] > ttls['warm'] > ttls['cold']
+    assert ttls['hot'] > ttls['busy']
+    assert all(54 <= ttl <= 600 for ttl in ttls.values())
+
+
+def test_jitter_spreads_expiry_of_keys_written_together(policy):
+    """Should not give identical TTLs to keys written at the same time."""
+    # when ... many fresh keys are stored at once
+    ttls = [policy.ttl_for('dog', str(key)) for key in range(100)]
+
+    # then
+    # ... TTLs are spread below the base TTL.
+    assert len(set(ttls)) > 1
+    assert all(54 <= ttl <= 60 for ttl in ttls)
+
+
+def test_non_adaptive_key_class_keeps_base_ttl(policy):
+    """Should not extend TTLs of non adaptive key classes."""
+    # given ... a key read many times
+    for _ in range(100):
+        policy.record_read('5')
+
+    # then ... its not found TTL is not extended.
+    assert policy.ttl_for('not_found', '5') <= 5
+
+
+def test_counts_decay_as_keys_cool_down(policy, clock):
+    """Should shorten TTLs again once a key stops being read."""
+    # given ... a hot key
+    replay(policy, [('read', 'hot')] * 100)
+    hot_ttl = policy.ttl_for('dog', 'hot')
+
+    # when ... several decay intervals pass with a single read
+    clock.now += 300 * 5
+    policy.record_read('other')
+
+    # then ... the key falls back towards the base TTL.
+    assert policy.counts('hot') == (3, 0)
+    assert policy.ttl_for('dog', 'hot') < hot_ttl
+
+
+def test_reports_effective_ttl_distribution(policy):
+    """Should summarise handed out TTLs per key class."""
+    # when ... the simulated trace is replayed
+    replay(policy, simulated_trace())
+    report = policy.distribution()
+
+    # then
+    # ... the report covers every TTL handed out per key class.
+    dog = report['dog']
+    assert dog['count'] == 1000
+    assert dog['min'] <= dog['p50'] <= dog['p90'] <= dog['p99'] <= dog['max']
+    assert dog['min'] <= dog['mean'] <= dog['max']
+    assert report['not_found'] == {'count': 0}
+
+
+def test_logs_ttl_distribution_periodically(policy, clock, mocker):
+    """Should log the TTL distribution once every report interval."""
+    logger = mocker.patch('cache.logger')
+
+    # when ... TTLs are handed out before and after the report interval
+    policy.ttl_for('dog', 'hot')
+    clock.now += 300
+    policy.ttl_for('dog', 'hot')
+    policy.ttl_for('dog', 'hot')
+
+    # then ... the distribution is logged once.
+    logger.info.assert_called_once_with('Memcache TTL distribution: %s', mocker.ANY)
+    assert logger.info.call_args[0][1]['dog']['count'] == 2
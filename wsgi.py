@@ -0,0 +1,5 @@
+"""WSGI entry point for running furryCompanions under gunicorn."""
+
+from app import app, start_resources  # noqa: F401
+
+start_resources()